@@ -2,4 +2,15 @@ from decouple import config as decouple_config
 
 
 DATABASE_URL = decouple_config("DATABASE_URL", default="")
-DB_TIMEZONE = decouple_config("DB_TIMEZONE", default="UTC")
\ No newline at end of file
+# Plain postgresql:// URLs would select psycopg2, use the psycopg 3 driver instead
+if DATABASE_URL.startswith("postgresql://"):
+    DATABASE_URL = "postgresql+psycopg://" + DATABASE_URL[len("postgresql://"):]
+DB_TIMEZONE = decouple_config("DB_TIMEZONE", default="UTC")
+
+# Engine / connection pool tuning
+DATABASE_ECHO = decouple_config("DATABASE_ECHO", default=False, cast=bool)
+DATABASE_POOL_SIZE = decouple_config("DATABASE_POOL_SIZE", default=10, cast=int)
+DATABASE_MAX_OVERFLOW = decouple_config("DATABASE_MAX_OVERFLOW", default=5, cast=int)
+DATABASE_POOL_TIMEOUT = decouple_config("DATABASE_POOL_TIMEOUT", default=10, cast=int)
+# Executions of the same query before psycopg 3 prepares it server-side (0 disables)
+DATABASE_PREPARE_THRESHOLD = decouple_config("DATABASE_PREPARE_THRESHOLD", default=5, cast=int)
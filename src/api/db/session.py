@@ -1,39 +1,73 @@
+from functools import lru_cache
+
 from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.engine import make_url
+from sqlalchemy.orm import sessionmaker, scoped_session
 from sqlmodel import SQLModel, Session
 
-from .config import DATABASE_URL
-
-# Import all models to register them with SQLModel.metadata
-# This ensures foreign key relationships are resolved correctly
-from ..v1.authors.models import Author
-from ..v1.books.models import Book
-from ..v1.users.models import User
-from ..v1.transactions.models import Transaction
+from .config import (
+    DATABASE_URL,
+    DATABASE_ECHO,
+    DATABASE_POOL_SIZE,
+    DATABASE_MAX_OVERFLOW,
+    DATABASE_POOL_TIMEOUT,
+    DATABASE_PREPARE_THRESHOLD,
+)
 
 if DATABASE_URL == "":
     raise NotImplementedError("DATABASE_URL needs to be set")
 
-# Create PostgreSQL engine
-engine = create_engine(
-    DATABASE_URL,
-    echo=True,  # Set to False in production
-    pool_pre_ping=True,  # Verify connections before use
-    pool_recycle=300,  # Recycle connections after 5 minutes
+# Create session factory, bound to the engine once get_engine() first runs
+# Instances keep their loaded state after commit, so writes don't need a refresh SELECT
+SessionLocal = sessionmaker(
+    autocommit=False, autoflush=False, expire_on_commit=False, class_=Session
 )
 
-# Create session factory
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# Thread-local session registry for code running outside a request (background tasks, scripts)
+ScopedSession = scoped_session(SessionLocal)
+
+
+@lru_cache(maxsize=1)
+def get_engine():
+    """Create the PostgreSQL engine on first use instead of at import time"""
+    connect_args = {}
+    if make_url(DATABASE_URL).get_driver_name() == "psycopg":
+        # Repeated queries (the prebuilt list statements) are prepared once per connection
+        connect_args["prepare_threshold"] = DATABASE_PREPARE_THRESHOLD
+    
+    engine = create_engine(
+        DATABASE_URL,
+        echo=DATABASE_ECHO,  # SQL logging, off unless DATABASE_ECHO is set
+        pool_size=DATABASE_POOL_SIZE,  # Persistent connections kept in the pool
+        max_overflow=DATABASE_MAX_OVERFLOW,  # Extra connections allowed under burst load
+        pool_timeout=DATABASE_POOL_TIMEOUT,  # Seconds to wait for a free connection
+        pool_pre_ping=True,  # Verify connections before use
+        pool_recycle=1800,  # Recycle connections after 30 minutes
+        connect_args=connect_args,
+    )
+    SessionLocal.configure(bind=engine)
+    return engine
 
 
 def init_db():
     """Initialize database tables"""
+    # Import all models to register them with SQLModel.metadata
+    # This ensures foreign key relationships are resolved correctly
+    from ..v1.authors.models import Author
+    from ..v1.books.models import Book
+    from ..v1.users.models import User
+    from ..v1.transactions.models import Transaction
+    from .versions import TableVersion
+
     print("Creating database tables...")
-    SQLModel.metadata.create_all(engine)
+    SQLModel.metadata.create_all(get_engine())
     print("Database tables created successfully!")
 
 
 def get_session():
     """Get database session - dependency for FastAPI"""
-    with Session(engine) as session:
-        yield session
\ No newline at end of file
+    db = SessionLocal(bind=get_engine())
+    try:
+        yield db
+    finally:
+        db.close()
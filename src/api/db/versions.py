@@ -0,0 +1,44 @@
+from sqlalchemy import DDL, event, select, update
+from sqlalchemy.orm import Session
+from sqlmodel import SQLModel, Field
+
+
+class TableVersion(SQLModel, table=True):
+    """Write counter per table, read to tag list responses (ETag)"""
+    __tablename__ = "table_version"
+
+    name: str = Field(primary_key=True, max_length=64)
+    version: int = Field(default=0)
+
+
+# Tables whose writes are counted - seeded once when the table is created
+VERSIONED_TABLES = ("user", "transaction")
+
+event.listen(
+    TableVersion.__table__,
+    "after_create",
+    DDL(
+        "INSERT INTO table_version (name, version) VALUES "
+        + ", ".join(f"('{name}', 0)" for name in VERSIONED_TABLES)
+    ),
+)
+
+
+def bump_table_version(db: Session, table_name: str) -> None:
+    """Count a write to the table - call inside the writing transaction, before commit
+
+    The counter row is locked until commit, so every committed write gets its own version.
+    Pending ORM changes are flushed first so every writer locks its own rows before the
+    counter; taking the two in different orders could deadlock concurrent writers
+    """
+    db.flush()
+    db.execute(
+        update(TableVersion)
+        .where(TableVersion.name == table_name)
+        .values(version=TableVersion.version + 1)
+    )
+
+
+def get_table_version(db: Session, table_name: str) -> int:
+    """Current write counter of the table, a single primary key lookup"""
+    return db.scalar(select(TableVersion.version).where(TableVersion.name == table_name)) or 0
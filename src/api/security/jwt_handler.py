@@ -1,7 +1,14 @@
 import os
-from datetime import datetime, timedelta, timezone
+import time
+import json
+import hmac
+import base64
+import hashlib
+import threading
+from datetime import timedelta
 from typing import Optional
 import jwt
+from cachetools import TLRUCache
 from decouple import config as decouple_config
 
 # JWT configuration
@@ -9,6 +16,62 @@ SECRET_KEY = decouple_config("SECRET_KEY", default="your-secret-key-change-in-pr
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = int(decouple_config("ACCESS_TOKEN_EXPIRE_MINUTES", default="30"))
 
+# Header and signing key never change, so encode them once at import
+_SECRET_KEY_BYTES = SECRET_KEY.encode("utf-8")
+_HEADER_B64 = b"eyJhbGciOiJIUzI1NiIsInR5cCI6IkpXVCJ9"  # base64url('{"alg":"HS256","typ":"JWT"}')
+
+# Verified token cache: token -> payload, least recently used evicted first. Each entry expires
+# at its own exp claim (ttu returns the absolute expiry on the time.time() clock)
+TOKEN_CACHE_MAXSIZE = 4096
+_token_cache: "TLRUCache[str, dict]" = TLRUCache(
+    maxsize=TOKEN_CACHE_MAXSIZE,
+    ttu=lambda token, payload, now: float(payload["exp"]),
+    timer=time.time,
+)
+_token_cache_lock = threading.Lock()
+
+
+def _base64url_encode(data: bytes) -> bytes:
+    """Base64url encode without padding, as required by the JWT spec"""
+    return base64.urlsafe_b64encode(data).rstrip(b"=")
+
+
+def _base64url_decode(data: bytes) -> bytes:
+    """Base64url decode, restoring the padding stripped by the JWT encoding"""
+    return base64.urlsafe_b64decode(data + b"=" * (-len(data) % 4))
+
+
+def _decode_hs256(token: str) -> dict:
+    """
+    Verify an HS256 token signature and expiry with the standard library
+    
+    Only tokens carrying the exact header issued by create_access_token are accepted,
+    which also rules out any other algorithm (including "none")
+    
+    Raises:
+        jwt.ExpiredSignatureError: If the exp claim is in the past
+        jwt.InvalidTokenError: If the token is malformed or the signature does not match
+    """
+    try:
+        header_b64, payload_b64, signature_b64 = token.encode("ascii").split(b".")
+        if header_b64 != _HEADER_B64:
+            raise jwt.InvalidTokenError("Unsupported token header")
+        
+        expected = hmac.new(_SECRET_KEY_BYTES, header_b64 + b"." + payload_b64, hashlib.sha256).digest()
+        if not hmac.compare_digest(expected, _base64url_decode(signature_b64)):
+            raise jwt.InvalidTokenError("Signature verification failed")
+        
+        payload = json.loads(_base64url_decode(payload_b64))
+    except ValueError:
+        # Wrong segment count, bad base64, non-ascii token or invalid JSON
+        raise jwt.InvalidTokenError("Malformed token")
+    
+    if not isinstance(payload, dict) or not isinstance(payload.get("exp"), (int, float)):
+        raise jwt.InvalidTokenError("Token is missing the exp claim")
+    if payload["exp"] <= time.time():
+        raise jwt.ExpiredSignatureError("Signature has expired")
+    return payload
+
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
     """
@@ -27,15 +90,21 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -
     if "sub" in to_encode and not isinstance(to_encode["sub"], str):
         to_encode["sub"] = str(to_encode["sub"])
     
+    # Expiry as integer epoch seconds - no datetime objects needed
     if expires_delta:
-        expire = datetime.now(timezone.utc) + expires_delta
+        expire = int(time.time()) + int(expires_delta.total_seconds())
     else:
-        expire = datetime.now(timezone.utc) + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+        expire = int(time.time()) + ACCESS_TOKEN_EXPIRE_MINUTES * 60
     
     to_encode.update({"exp": expire})
-    encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     
-    return encoded_jwt
+    # Sign header.payload with HS256 directly instead of going through PyJWT's generic encoder
+    payload_b64 = _base64url_encode(json.dumps(to_encode, separators=(",", ":")).encode("utf-8"))
+    signing_input = _HEADER_B64 + b"." + payload_b64
+    signature = hmac.new(_SECRET_KEY_BYTES, signing_input, hashlib.sha256).digest()
+    encoded_jwt = signing_input + b"." + _base64url_encode(signature)
+    
+    return encoded_jwt.decode("ascii")
 
 
 def verify_token(token: str) -> dict:
@@ -51,13 +120,23 @@ def verify_token(token: str) -> dict:
     Raises:
         jwt.InvalidTokenError: If token is invalid
     """
+    # Tokens already verified are served from the cache until they expire
+    with _token_cache_lock:
+        cached = _token_cache.get(token)
+    if cached is not None:
+        return dict(cached)
+    
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        payload = _decode_hs256(token)
         # Convert 'sub' back to integer if present
         if "sub" in payload and isinstance(payload["sub"], str):
             payload["sub"] = int(payload["sub"])
-        return payload
     except jwt.ExpiredSignatureError as e:
         raise jwt.InvalidTokenError("Token has expired")
     except jwt.InvalidTokenError as e:
         raise jwt.InvalidTokenError("Invalid token")
+    
+    # exp is a required claim, so every cached entry has a bounded lifetime
+    with _token_cache_lock:
+        _token_cache[token] = dict(payload)
+    return payload
@@ -1,4 +1,9 @@
 import bcrypt
+from decouple import config as decouple_config
+
+# bcrypt cost factor for new hashes (2^rounds iterations). Existing hashes keep the cost they
+# were created with, so this can be tuned without invalidating stored passwords
+BCRYPT_ROUNDS = decouple_config("BCRYPT_ROUNDS", default=12, cast=int)
 
 
 def hash_password(password: str) -> str:
@@ -11,7 +16,7 @@ def hash_password(password: str) -> str:
     Returns:
         Hashed password
     """
-    salt = bcrypt.gensalt()
+    salt = bcrypt.gensalt(rounds=BCRYPT_ROUNDS)
     return bcrypt.hashpw(password.encode('utf-8'), salt).decode('utf-8')
 
 
@@ -1,7 +1,8 @@
 from datetime import datetime, timezone
 from typing import Optional, List, TYPE_CHECKING
+from pydantic import ConfigDict
 from sqlmodel import SQLModel, Field, Relationship
-from sqlalchemy import Index
+from sqlalchemy import Index, DDL, event
 
 if TYPE_CHECKING:
     from ..books.models import Book
@@ -28,10 +29,24 @@ class Author(AuthorBase, table=True):
     __table_args__ = (
         Index('idx_author_name', 'name'),                    # Index on name for search queries
         Index('idx_author_email', 'email'),                  # Index on email for uniqueness checks
-        Index('idx_author_nationality', 'nationality'),      # Index for filtering by nationality
-        Index('idx_author_name_nationality', 'name', 'nationality'),  # Composite index
+        Index('idx_author_nationality_name', 'nationality', 'name'),  # Composite index, also serves nationality filtering
+        # Trigram GIN indexes so ILIKE '%term%' search/filters can use an index scan (PostgreSQL only)
+        Index('idx_author_name_trgm', 'name', postgresql_using='gin',
+              postgresql_ops={'name': 'gin_trgm_ops'}).ddl_if(dialect='postgresql'),
+        Index('idx_author_email_trgm', 'email', postgresql_using='gin',
+              postgresql_ops={'email': 'gin_trgm_ops'}).ddl_if(dialect='postgresql'),
+        Index('idx_author_nationality_trgm', 'nationality', postgresql_using='gin',
+              postgresql_ops={'nationality': 'gin_trgm_ops'}).ddl_if(dialect='postgresql'),
     )
 
+
+# The trigram indexes need the pg_trgm extension, create it before any table is created
+event.listen(
+    SQLModel.metadata,
+    "before_create",
+    DDL("CREATE EXTENSION IF NOT EXISTS pg_trgm").execute_if(dialect="postgresql"),
+)
+
 class AuthorCreate(AuthorBase):
     """Schema for creating a new Author"""
     pass
@@ -55,7 +70,11 @@ class BookSummary(SQLModel):
 
 class AuthorResponse(AuthorBase):
     """Schema for Author response"""
+    model_config = ConfigDict(from_attributes=True, populate_by_name=True)
+    
     id: int
-    books: List[BookSummary] = []
+    # None when books were not loaded - dropped by response_model_exclude_none, so a
+    # missing key means "not requested" and [] means "no books"
+    books: Optional[List[BookSummary]] = None
     created_at: datetime
     updated_at: datetime
\ No newline at end of file
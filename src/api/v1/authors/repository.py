@@ -1,9 +1,34 @@
-from sqlalchemy.orm import Session, selectinload
+from sqlalchemy import select, insert, update, delete, exists, bindparam
+from sqlalchemy.orm import Session, selectinload, joinedload, raiseload
 from sqlalchemy.exc import IntegrityError, SQLAlchemyError
 from typing import List, Optional
 from datetime import datetime, timezone
 
-from .models import Author, AuthorCreate, AuthorUpdate
+from .models import Author, AuthorCreate
+
+# Base statement shared by all author readers, narrowed per call with .where()/.options()
+AUTHOR_SELECT = select(Author)
+
+
+def _build_authors_statement(has_search: bool, has_nationality: bool):
+    """Build the list statement for one filter combination, values are bound at execution"""
+    stmt = AUTHOR_SELECT.options(raiseload("*"))
+    if has_search:
+        stmt = stmt.where(
+            (Author.name.ilike(bindparam("search"))) |
+            (Author.email.ilike(bindparam("search")))
+        )
+    if has_nationality:
+        stmt = stmt.where(Author.nationality.ilike(bindparam("nationality")))
+    return stmt.offset(bindparam("skip")).limit(bindparam("limit"))
+
+
+# One pre-built statement per (search, nationality) combination used by get_authors
+AUTHORS_STATEMENTS = {
+    (has_search, has_nationality): _build_authors_statement(has_search, has_nationality)
+    for has_search in (False, True)
+    for has_nationality in (False, True)
+}
 
 
 def create_author(db: Session, author_data: AuthorCreate) -> Author:
@@ -11,8 +36,8 @@ def create_author(db: Session, author_data: AuthorCreate) -> Author:
     try:
         db_author = Author(**author_data.model_dump())
         db.add(db_author)
+        # id comes back from the INSERT and timestamps are set in Python, no refresh needed
         db.commit()
-        db.refresh(db_author)
         return db_author
     except IntegrityError as e:
         db.rollback()
@@ -25,22 +50,47 @@ def create_author(db: Session, author_data: AuthorCreate) -> Author:
         raise RuntimeError(f"Database error while creating author: {str(e)}")
 
 
+def create_authors_bulk(db: Session, items: List[AuthorCreate]) -> List[Author]:
+    """Create many authors in one INSERT ... RETURNING (batched by insertmanyvalues)"""
+    if not items:
+        return []
+    try:
+        authors = db.scalars(
+            insert(Author).returning(Author),
+            [item.model_dump() for item in items]
+        ).all()
+        db.commit()
+        return authors
+    except IntegrityError as e:
+        db.rollback()
+        raise ValueError(f"Data integrity error: {str(e)}")
+    except SQLAlchemyError as e:
+        db.rollback()
+        raise RuntimeError(f"Database error while creating authors: {str(e)}")
+
+
 def get_author(db: Session, author_id: int) -> Optional[Author]:
     """Get author by ID with books data"""
     try:
-        return db.query(Author).options(
-            selectinload(Author.books)
-        ).filter(Author.id == author_id).first()
+        # A single parent with few children - join the books in instead of a second SELECT
+        stmt = AUTHOR_SELECT.options(
+            joinedload(Author.books),
+            raiseload("*")
+        ).where(Author.id == author_id)
+        return db.execute(stmt).unique().scalars().first()
     except SQLAlchemyError as e:
         raise RuntimeError(f"Database error while retrieving author: {str(e)}")
 
 
-def get_author_by_email(db: Session, email: str) -> Optional[Author]:
-    """Get author by email"""
+def email_exists(db: Session, email: str, exclude_author_id: Optional[int] = None) -> bool:
+    """Check whether an author already uses the email without loading the row"""
     try:
-        return db.query(Author).filter(Author.email == email).first()
+        condition = Author.email == email
+        if exclude_author_id is not None:
+            condition = condition & (Author.id != exclude_author_id)
+        return db.execute(select(exists().where(condition))).scalar()
     except SQLAlchemyError as e:
-        raise RuntimeError(f"Database error while retrieving author: {str(e)}")
+        raise RuntimeError(f"Database error while checking author email: {str(e)}")
 
 
 def get_authors(
@@ -48,44 +98,39 @@ def get_authors(
     skip: int = 0,
     limit: int = 10,
     search: Optional[str] = None,
-    nationality: Optional[str] = None
+    nationality: Optional[str] = None,
+    with_books: bool = False
 ) -> List[Author]:
-    """Get multiple authors with filtering and prefetched books data"""
+    """Get multiple authors with filtering, books data is prefetched only when requested"""
     try:
-        query = db.query(Author).options(
-            selectinload(Author.books)
-        )
+        # Statements raise on any relationship that is not explicitly loaded
+        stmt = AUTHORS_STATEMENTS[(bool(search), bool(nationality))]
+        if with_books:
+            stmt = stmt.options(selectinload(Author.books))
         
         # Apply filters
+        params = {"skip": skip, "limit": limit}
         if search:
-            query = query.filter(
-                (Author.name.ilike(f"%{search}%")) |
-                (Author.email.ilike(f"%{search}%"))
-            )
-        
+            params["search"] = f"%{search}%"
         if nationality:
-            query = query.filter(Author.nationality.ilike(f"%{nationality}%"))
+            params["nationality"] = f"%{nationality}%"
         
-        return query.offset(skip).limit(limit).all()
+        return db.execute(stmt, params).scalars().all()
     except SQLAlchemyError as e:
         raise RuntimeError(f"Database error while retrieving authors: {str(e)}")
 
 
-def update_author(db: Session, author: Author, author_update: AuthorUpdate) -> Author:
-    """Update author information and return with books data"""
+def update_author_by_id(db: Session, author_id: int, patch: dict) -> Optional[Author]:
+    """Update author fields in a single UPDATE ... RETURNING, None if the author does not exist"""
     try:
-        update_data = author_update.model_dump(exclude_unset=True)
-        if update_data:
-            update_data["updated_at"] = datetime.now(timezone.utc)
-            for field, value in update_data.items():
-                setattr(author, field, value)
-            db.commit()
-            db.refresh(author)
-            
-            # If email was updated, reload the author with books data
-            if 'email' in update_data:
-                return get_author(db, author.id)
-        
+        stmt = update(Author).where(Author.id == author_id).values(
+            **patch, updated_at=datetime.now(timezone.utc)
+        ).returning(Author)
+        author = db.execute(stmt).scalar_one_or_none()
+        db.commit()
+        # Book list pages embed the author summary
+        from ..books.repository import invalidate_books_cache
+        invalidate_books_cache()
         return author
     except IntegrityError as e:
         db.rollback()
@@ -97,11 +142,46 @@ def update_author(db: Session, author: Author, author_update: AuthorUpdate) -> A
         raise RuntimeError(f"Database error while updating author: {str(e)}")
 
 
-def delete_author(db: Session, author: Author) -> None:
-    """Delete an author"""
+def authors_to_response(db: Session, authors: List[Author], with_books: bool = True) -> List[dict]:
+    """Convert authors to responses, books get their available copies from one batch of count queries
+    
+    Without books the key is left out entirely, so it is not mistaken for an author with no books
+    """
+    if not with_books:
+        return [author.model_dump() for author in authors]
+    
+    from ..books.repository import bulk_compute_counts
+    counts = bulk_compute_counts(db, [book.isbn for author in authors for book in author.books])
+    return [
+        {
+            **author.model_dump(),
+            "books": [
+                {**book.model_dump(), "available_copies": counts.get(book.isbn, (0, 0))[1]}
+                for book in author.books
+            ],
+        }
+        for author in authors
+    ]
+
+
+def author_has_books(db: Session, author_id: int) -> bool:
+    """Check whether any book references the author without loading the books"""
+    from ..books.models import Book
+    
+    try:
+        return db.execute(select(exists().where(Book.author_id == author_id))).scalar()
+    except SQLAlchemyError as e:
+        raise RuntimeError(f"Database error while checking author books: {str(e)}")
+
+
+def delete_author_by_id(db: Session, author_id: int) -> bool:
+    """Delete an author in a single DELETE ... RETURNING, False if the author does not exist"""
     try:
-        db.delete(author)
+        deleted_id = db.execute(
+            delete(Author).where(Author.id == author_id).returning(Author.id)
+        ).scalar_one_or_none()
         db.commit()
+        return deleted_id is not None
     except SQLAlchemyError as e:
         db.rollback()
-        raise RuntimeError(f"Database error while deleting author: {str(e)}")
\ No newline at end of file
+        raise RuntimeError(f"Database error while deleting author: {str(e)}")
@@ -1,7 +1,10 @@
 from datetime import datetime, timezone
 from typing import Optional, TYPE_CHECKING
 from sqlmodel import SQLModel, Field, Relationship
-from sqlalchemy import Index
+from sqlalchemy import Index, func, literal_column
+# Registers the PostgreSQL full-text functions (to_tsvector, plainto_tsquery) before they are
+# used below - the engine, which would otherwise import the dialect, is only created on first use
+import sqlalchemy.dialects.postgresql  # noqa: F401
 
 if TYPE_CHECKING:
     from ..authors.models import Author
@@ -23,10 +26,26 @@ class Book(BookBase, table=True):
     
     # Add indexes for better query performance
     __table_args__ = (
-        Index('idx_book_author_id', 'author_id'),   # Index on author_id for filtering by author
-        Index('idx_book_title_author', 'title', 'author_id'),  # Composite index for title + author queries
+        # Composite index led by author_id - serves author filtering on its own and author + title queries
+        Index('idx_book_author_title', 'author_id', 'title'),
+        # No trigram indexes on title/isbn: on PostgreSQL book search goes through the full-text
+        # index below, the ILIKE '%term%' branch only runs on other databases
     )
 
+# Full-text search document over title, ISBN and description. get_books must filter on this exact
+# expression so PostgreSQL can use the GIN index below; constants are inlined rather than bound
+# for the same reason
+BOOK_SEARCH_DOCUMENT = func.to_tsvector(
+    literal_column("'english'"),
+    func.coalesce(Book.title, literal_column("''")) + literal_column("' '")
+    + func.coalesce(Book.isbn, literal_column("''")) + literal_column("' '")
+    + func.coalesce(Book.description, literal_column("''")),
+)
+# Expression indexes are not inferred onto the table, so attach it explicitly
+Book.__table__.append_constraint(
+    Index('idx_book_search_tsv', BOOK_SEARCH_DOCUMENT, postgresql_using='gin').ddl_if(dialect='postgresql')
+)
+
 class BookCreate(BookBase):
     """Schema for creating a new book"""
     pass
@@ -1,51 +1,108 @@
-from sqlalchemy.orm import Session, selectinload
+import threading
+from functools import lru_cache
+from cachetools import TTLCache
+from sqlalchemy.orm import Session, selectinload, raiseload
 from sqlalchemy.exc import IntegrityError, SQLAlchemyError
-from sqlalchemy import func
-from typing import List, Optional
+from sqlalchemy import func, select, insert, distinct, exists, literal_column, lambda_stmt, bindparam, union
+from typing import Dict, Iterator, List, Optional, Tuple
 from datetime import datetime, timezone
 
-from .models import Book, BookCreate, BookUpdate
+from .models import Book, BookCreate, BookUpdate, BOOK_SEARCH_DOCUMENT
 
 
-def calculate_total_copies(db: Session, book_id: int) -> int:
-    """Calculate total copies of a book by counting all book entries with same ISBN"""
+# Serialized book list pages keyed by the query parameters, cleared by any write that changes them
+# Each worker process keeps its own cache, so the TTL bounds staleness across workers
+BOOKS_LIST_CACHE_TTL = 60
+_books_list_cache = TTLCache(maxsize=512, ttl=BOOKS_LIST_CACHE_TTL)
+_books_list_cache_lock = threading.Lock()
+
+
+def get_cached_books_page(key: tuple) -> Optional[List[dict]]:
+    """Return a cached book list page, or None if it is missing or expired"""
+    with _books_list_cache_lock:
+        return _books_list_cache.get(key)
+
+
+def cache_books_page(key: tuple, page: List[dict]) -> None:
+    """Store a serialized book list page"""
+    with _books_list_cache_lock:
+        _books_list_cache[key] = page
+
+
+def invalidate_books_cache() -> None:
+    """Drop all cached book list pages after a write to books, authors or transactions"""
+    with _books_list_cache_lock:
+        _books_list_cache.clear()
+
+
+def calculate_copy_counts(db: Session, book_id: int) -> Tuple[int, int]:
+    """Calculate (total, available) copies for the book's ISBN in a single query
+    
+    Total is the number of book entries sharing the ISBN, available subtracts
+    the ones currently in a transaction that is not returned
+    """
     try:
-        book = db.query(Book).filter(Book.id == book_id).first()
-        if not book or not book.isbn:
-            return 1
+        from ..transactions.models import Transaction
+        
+        isbn = select(Book.isbn).where(Book.id == book_id).scalar_subquery()
+        total, borrowed = db.execute(
+            select(func.count(distinct(Book.id)), func.count(Transaction.id))
+            .select_from(Book)
+            .outerjoin(
+                Transaction, (Book.id == Transaction.book_id) & (Transaction.is_returned == False)
+            )
+            .where(Book.isbn == isbn)
+        ).one()
+        if not total:
+            return 1, 1
         
-        # Count all books with the same ISBN
-        count = db.query(func.count(Book.id)).filter(Book.isbn == book.isbn).scalar()
-        return count or 1
+        return total, max(0, total - borrowed)
     except SQLAlchemyError:
-        return 1
+        return 1, 1
 
 
-def calculate_available_copies(db: Session, book_id: int) -> int:
-    """Calculate available copies by counting books not currently borrowed"""
+def bulk_compute_counts(db: Session, isbns: List[str]) -> Dict[str, Tuple[int, int]]:
+    """Calculate (total, available) copies per ISBN for a whole page of books
+    
+    Two GROUP BY queries regardless of the number of books, instead of one
+    count query per book
+    """
+    if not isbns:
+        return {}
     try:
         from ..transactions.models import Transaction
         
-        # Get the book's ISBN
-        book = db.query(Book).filter(Book.id == book_id).first()
-        if not book or not book.isbn:
-            return 1
-        
-        # Count total books with this ISBN
-        total = db.query(func.count(Book.id)).filter(Book.isbn == book.isbn).scalar() or 1
+        unique_isbns = list(set(isbns))
+        totals = dict(db.execute(
+            select(Book.isbn, func.count(Book.id))
+            .where(Book.isbn.in_(unique_isbns))
+            .group_by(Book.isbn)
+        ).all())
+        borrowed = dict(db.execute(
+            select(Book.isbn, func.count(Transaction.id))
+            .join(Transaction, Transaction.book_id == Book.id)
+            .where(Transaction.is_returned == False, Book.isbn.in_(unique_isbns))
+            .group_by(Book.isbn)
+        ).all())
         
-        # Count currently borrowed books (books in transactions that are not returned)
-        borrowed = db.query(func.count(Book.id)).join(
-            Transaction, Book.id == Transaction.book_id
-        ).filter(
-            Book.isbn == book.isbn,
-            Transaction.is_returned == False
-        ).scalar() or 0
-        
-        available = total - borrowed
-        return max(0, available)
+        return {
+            isbn: (total, max(0, total - borrowed.get(isbn, 0)))
+            for isbn, total in totals.items()
+        }
     except SQLAlchemyError:
-        return 1
+        return {}
+
+
+def calculate_total_copies(db: Session, book_id: int) -> int:
+    """Calculate total copies of a book by counting all book entries with same ISBN"""
+    total, _ = calculate_copy_counts(db, book_id)
+    return total
+
+
+def calculate_available_copies(db: Session, book_id: int) -> int:
+    """Calculate available copies by counting books not currently borrowed"""
+    _, available = calculate_copy_counts(db, book_id)
+    return available
 
 
 def create_book(db: Session, book_data: BookCreate) -> Book:
@@ -55,16 +112,16 @@ def create_book(db: Session, book_data: BookCreate) -> Book:
     Multiple copies of the same ISBN are allowed
     """
     try:
-        # Create new book entry
-        db_book = Book(**book_data.model_dump())
-        db.add(db_book)
+        # Create new book entry - a single INSERT ... RETURNING, no refresh SELECT afterwards
+        db_book = db.scalars(insert(Book).returning(Book), [book_data.model_dump()]).one()
         db.commit()
-        db.refresh(db_book)
+        invalidate_books_cache()
         return db_book
     except IntegrityError as e:
         db.rollback()
-        # Foreign key constraint violation (author doesn't exist)
-        if "author_id" in str(e):
+        # Foreign key constraint violation (author doesn't exist). Match on the driver message
+        # only - str(e) includes the SQL, which always names author_id
+        if "author_id" in str(e.orig):
             raise ValueError("Author with the specified ID does not exist")
         raise ValueError(f"Data integrity error: {str(e)}")
     except SQLAlchemyError as e:
@@ -73,60 +130,144 @@ def create_book(db: Session, book_data: BookCreate) -> Book:
 
 
 def get_book(db: Session, book_id: int) -> Optional[Book]:
-    """Get book by ID with author data"""
-    return db.query(Book).options(
-        selectinload(Book.author)
-    ).filter(Book.id == book_id).first()
+    """Get book by ID with author data, served from the identity map if already loaded"""
+    return db.get(Book, book_id, options=[
+        selectinload(Book.author),
+        raiseload("*")  # Any other relationship access fails instead of lazy loading
+    ])
 
 
 def get_book_by_isbn(db: Session, isbn: str) -> Optional[Book]:
-    """Get book by ISBN with author data"""
-    return db.query(Book).options(
-        selectinload(Book.author)
-    ).filter(Book.isbn == isbn).first()
+    """Get book by ISBN with author data
+    
+    lambda_stmt caches the constructed and compiled SELECT by the lambda's code location,
+    so repeat calls only bind the isbn closure variable as a parameter
+    """
+    stmt = lambda_stmt(
+        lambda: select(Book).options(
+            selectinload(Book.author),
+            raiseload("*")  # Any other relationship access fails instead of lazy loading
+        ).where(Book.isbn == isbn).limit(1)
+    )
+    return db.scalars(stmt).first()
 
 
-def get_books(
-    db: Session,
-    skip: int = 0,
-    limit: int = 10,
-    search: Optional[str] = None,
-    author_id: Optional[int] = None,
-    available_only: bool = False
-) -> List[Book]:
-    """Get multiple books with filtering and prefetched author data"""
+# Rows fetched per round-trip when iterating book results
+BOOKS_YIELD_PER = 100
+
+
+@lru_cache(maxsize=32)
+def _build_books_statement(
+    has_search: bool,
+    has_author: bool,
+    available_only: bool,
+    full_text: bool,
+    paginated: bool
+):
+    """Build the book SELECT for one filter combination, values are bound at execution
+    
+    Cached per combination, so requests only bind parameters instead of assembling the
+    statement. Built lazily (not at import) because the options need all mappers configured
+    """
     from ..authors.models import Author
     from ..transactions.models import Transaction
     
-    query = db.query(Book).options(
-        selectinload(Book.author)
+    stmt = select(Book).options(
+        selectinload(Book.author),
+        raiseload("*")  # Any other relationship access fails instead of lazy loading
     )
     
     # Apply filters
-    if search:
-        # Join with author for name search, use LEFT JOIN to include books without authors
-        query = query.outerjoin(Author, Book.author_id == Author.id).filter(
-            (Book.title.ilike(f"%{search}%")) |
-            (Book.isbn.ilike(f"%{search}%")) |
-            (Author.name.ilike(f"%{search}%"))
-        )
+    if has_search:
+        if full_text:
+            # An OR across book and author columns can only be checked row by row after the join,
+            # so collect the matching ids per index and UNION them: the full-text match on
+            # title/ISBN/description uses idx_book_search_tsv, the author name idx_author_name_trgm
+            tsquery = func.plainto_tsquery(literal_column("'english'"), bindparam("search"))
+            matching_ids = union(
+                select(Book.id).where(BOOK_SEARCH_DOCUMENT.op("@@")(tsquery)),
+                select(Book.id).join(Author, Book.author_id == Author.id)
+                .where(Author.name.ilike(bindparam("pattern"))),
+            )
+            stmt = stmt.where(Book.id.in_(matching_ids))
+        else:
+            # Join with author for name search, use LEFT JOIN to include books without authors
+            stmt = stmt.outerjoin(Author, Book.author_id == Author.id)
+            stmt = stmt.where(
+                (Book.title.ilike(bindparam("pattern"))) |
+                (Book.isbn.ilike(bindparam("pattern"))) |
+                (Author.name.ilike(bindparam("pattern")))
+            )
     
-    if author_id:
-        query = query.filter(Book.author_id == author_id)
+    if has_author:
+        stmt = stmt.where(Book.author_id == bindparam("author_id"))
     
-    # For available_only filter: only include books that have at least one copy not borrowed
+    # For available_only filter: only include books whose ISBN has at least one copy not borrowed
     if available_only:
-        # Join with transactions to count borrowed copies
-        query = query.outerjoin(
-            Transaction, (Book.id == Transaction.book_id) & (Transaction.is_returned == False)
-        ).group_by(Book.id).having(
-            # Count of this book in active transactions < total count of this ISBN
-            func.count(Transaction.id) < (
-                db.query(func.count(Book.id)).filter(Book.isbn == Book.isbn).correlate(Book).as_scalar()
-            )
+        # Copies and borrowed copies per ISBN, each aggregated once for the whole query
+        totals = select(Book.isbn, func.count(Book.id).label("n")).group_by(Book.isbn).cte("isbn_totals")
+        borrowed = (
+            select(Book.isbn, func.count(Transaction.id).label("b"))
+            .join(Transaction, Transaction.book_id == Book.id)
+            .where(Transaction.is_returned == False)
+            .group_by(Book.isbn)
+            .cte("isbn_borrowed")
         )
+        stmt = stmt.join(totals, Book.isbn == totals.c.isbn).outerjoin(
+            borrowed, Book.isbn == borrowed.c.isbn
+        ).where(totals.c.n - func.coalesce(borrowed.c.b, 0) > 0)
     
-    return query.offset(skip).limit(limit).all()
+    if paginated:
+        return stmt.offset(bindparam("skip")).limit(bindparam("limit"))
+    # Only the unpaginated export streams: yield_per turns on server-side cursors, which would
+    # add DECLARE/FETCH/CLOSE round trips to every small list page
+    return stmt.execution_options(yield_per=BOOKS_YIELD_PER)
+
+
+def _books_statement_and_params(
+    db: Session,
+    search: Optional[str],
+    author_id: Optional[int],
+    available_only: bool,
+    paginated: bool
+):
+    """Pick the cached statement for the given filters and the parameters to bind to it"""
+    stmt = _build_books_statement(
+        bool(search), bool(author_id), available_only,
+        db.get_bind().dialect.name == "postgresql", paginated
+    )
+    params = {}
+    if search:
+        params["search"] = search
+        params["pattern"] = f"%{search}%"
+    if author_id:
+        params["author_id"] = author_id
+    return stmt, params
+
+
+def get_books(
+    db: Session,
+    skip: int = 0,
+    limit: int = 10,
+    search: Optional[str] = None,
+    author_id: Optional[int] = None,
+    available_only: bool = False
+) -> List[Book]:
+    """Get multiple books with filtering and prefetched author data"""
+    stmt, params = _books_statement_and_params(db, search, author_id, available_only, paginated=True)
+    params.update(skip=skip, limit=limit)
+    return db.scalars(stmt, params).all()
+
+
+def iter_books(
+    db: Session,
+    search: Optional[str] = None,
+    author_id: Optional[int] = None,
+    available_only: bool = False
+) -> Iterator[Book]:
+    """Stream every matching book, fetching BOOKS_YIELD_PER rows at a time (exports)"""
+    stmt, params = _books_statement_and_params(db, search, author_id, available_only, paginated=False)
+    yield from db.scalars(stmt, params)
 
 
 def update_book(db: Session, book: Book, book_update: BookUpdate) -> Book:
@@ -138,18 +279,18 @@ def update_book(db: Session, book: Book, book_update: BookUpdate) -> Book:
             for field, value in update_data.items():
                 setattr(book, field, value)
             db.commit()
-            db.refresh(book)
+            invalidate_books_cache()
             
-            # If author_id was updated, reload the book with new author data
+            # Instances are not expired on commit, so the loaded author is stale after an author_id change
             if 'author_id' in update_data:
-                return get_book(db, book.id)
+                db.refresh(book, ["author"])
         
         return book
     except IntegrityError as e:
         db.rollback()
-        if "author_id" in str(e):
+        if "author_id" in str(e.orig):
             raise ValueError("Author with the specified ID does not exist")
-        if "isbn" in str(e):
+        if "isbn" in str(e.orig):
             raise ValueError("Book with this ISBN already exists")
         raise ValueError(f"Data integrity error: {str(e)}")
     except SQLAlchemyError as e:
@@ -161,12 +302,12 @@ def delete_book(db: Session, book: Book) -> None:
     """Delete a book"""
     db.delete(book)
     db.commit()
+    invalidate_books_cache()
 
 
 def check_book_availability(db: Session, book: Book) -> dict:
     """Check book availability status - calculated on demand"""
-    total = calculate_total_copies(db, book.id)
-    available = calculate_available_copies(db, book.id)
+    total, available = calculate_copy_counts(db, book.id)
     
     return {
         "book_id": book.id,
@@ -179,14 +320,26 @@ def check_book_availability(db: Session, book: Book) -> dict:
 
 
 def is_book_borrowed(db: Session, book: Book) -> bool:
-    """Check if book has any borrowed copies - calculated on demand"""
-    available = calculate_available_copies(db, book.id)
-    total = calculate_total_copies(db, book.id)
-    return available < total
+    """Check if any copy of the book's ISBN is in an unreturned transaction, stopping at the first match
+    
+    Loans are not tied to a physical copy (any book_id of the ISBN can be borrowed as long as
+    the ISBN has a free copy), so a copy only counts as free when no copy of its ISBN is out
+    """
+    from ..transactions.models import Transaction
+    
+    return db.execute(select(exists().where(
+        Transaction.book_id == Book.id,
+        Book.isbn == book.isbn,
+        Transaction.is_returned == False
+    ))).scalar()
 
 
-def book_to_response(db: Session, book: Book) -> dict:
-    """Convert book to response with calculated fields"""
+def book_to_response(db: Session, book: Book, counts: Optional[Tuple[int, int]] = None) -> dict:
+    """Convert book to response with calculated fields
+    
+    Pass precomputed (total, available) counts to skip the per-book count query
+    """
+    total, available = counts if counts is not None else calculate_copy_counts(db, book.id)
     return {
         "id": book.id,
         "title": book.title,
@@ -194,8 +347,8 @@ def book_to_response(db: Session, book: Book) -> dict:
         "published_year": book.published_year,
         "author_id": book.author_id,
         "description": book.description,
-        "total_copies": calculate_total_copies(db, book.id),
-        "available_copies": calculate_available_copies(db, book.id),
+        "total_copies": total,
+        "available_copies": available,
         "author": {
             "id": book.author.id,
             "name": book.author.name,
@@ -203,4 +356,10 @@ def book_to_response(db: Session, book: Book) -> dict:
         } if book.author else None,
         "created_at": book.created_at,
         "updated_at": book.updated_at,
-    }
\ No newline at end of file
+    }
+
+
+def books_to_response(db: Session, books: List[Book]) -> List[dict]:
+    """Convert a page of books to responses, computing copy counts for all of them at once"""
+    counts = bulk_compute_counts(db, [book.isbn for book in books])
+    return [book_to_response(db, book, counts.get(book.isbn, (1, 1))) for book in books]
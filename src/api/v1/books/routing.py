@@ -6,26 +6,18 @@ from .models import BookCreate, BookUpdate, BookResponse
 from .repository import (
     create_book, get_book, get_book_by_isbn, get_books, 
     update_book, delete_book, check_book_availability, is_book_borrowed,
-    book_to_response
+    book_to_response, books_to_response, get_cached_books_page, cache_books_page
 )
 from ...db.session import get_session
-from ..users.routing import get_current_user
-from ..users.models import UserRole
+from ..users.routing import get_current_user, require_admin
 
 router = APIRouter()
 
 
-def require_admin(current_user = Depends(get_current_user)):
-    """Dependency to require admin role"""
-    if current_user.role != UserRole.ADMIN:
-        raise HTTPException(status_code=403, detail="Admin access required")
-    return current_user
-
-
 @router.post("/", response_model=BookResponse, status_code=201)
-async def create_book_endpoint(
+def create_book_endpoint(
     book_data: BookCreate,
-    db: Session = Depends(get_session),
+    db: Session = Depends(get_session, scope="function"),
     current_user = Depends(require_admin)
 ):
     """Create a new book in the library - Admin Only"""
@@ -41,16 +33,22 @@ async def create_book_endpoint(
         raise HTTPException(status_code=500, detail="An unexpected error occurred while creating the book")
 
 @router.get("/", response_model=List[BookResponse])
-async def get_books_endpoint(
+def get_books_endpoint(
     skip: int = Query(0, ge=0, description="Number of books to skip"),
     limit: int = Query(10, ge=1, le=100, description="Number of books to return"),
     search: Optional[str] = Query(None, description="Search by title or ISBN"),
     author_id: Optional[int] = Query(None, description="Filter by author ID"),
     available_only: bool = Query(False, description="Show only available books"),
-    db: Session = Depends(get_session),
+    db: Session = Depends(get_session, scope="function"),
     current_user = Depends(get_current_user)
 ):
     """Get list of books with optional filtering and pagination - Protected (All Users)"""
+    # Repeated listings are served from the cache until a write invalidates it
+    cache_key = (skip, limit, search, author_id, available_only)
+    page = get_cached_books_page(cache_key)
+    if page is not None:
+        return page
+    
     books = get_books(
         db=db,
         skip=skip,
@@ -59,12 +57,14 @@ async def get_books_endpoint(
         author_id=author_id,
         available_only=available_only
     )
-    return [book_to_response(db, book) for book in books]
+    page = books_to_response(db, books)
+    cache_books_page(cache_key, page)
+    return page
 
 @router.get("/{book_id}", response_model=BookResponse)
-async def get_book_endpoint(
+def get_book_endpoint(
     book_id: int,
-    db: Session = Depends(get_session),
+    db: Session = Depends(get_session, scope="function"),
     current_user = Depends(get_current_user)
 ):
     """Get details of a specific book - Protected (All Users)"""
@@ -77,10 +77,10 @@ async def get_book_endpoint(
     return book_to_response(db, book)
 
 @router.patch("/{book_id}", response_model=BookResponse)
-async def update_book_endpoint(
+def update_book_endpoint(
     book_id: int,
     book_update: BookUpdate,
-    db: Session = Depends(get_session),
+    db: Session = Depends(get_session, scope="function"),
     current_user = Depends(require_admin)
 ):
     """Update book information - Admin Only"""
@@ -103,9 +103,9 @@ async def update_book_endpoint(
         raise HTTPException(status_code=500, detail="An unexpected error occurred while updating the book")
 
 @router.delete("/{book_id}", status_code=204)
-async def delete_book_endpoint(
+def delete_book_endpoint(
     book_id: int,
-    db: Session = Depends(get_session),
+    db: Session = Depends(get_session, scope="function"),
     current_user = Depends(require_admin)
 ):
     """Remove a book from the library - Admin Only"""
@@ -127,9 +127,9 @@ async def delete_book_endpoint(
     return None
 
 @router.get("/{book_id}/availability")
-async def check_book_availability_endpoint(
+def check_book_availability_endpoint(
     book_id: int,
-    db: Session = Depends(get_session),
+    db: Session = Depends(get_session, scope="function"),
     current_user = Depends(get_current_user)
 ):
     """Check availability status of a specific book - Protected (All Users)"""
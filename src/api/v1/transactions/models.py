@@ -1,7 +1,7 @@
 from datetime import datetime, timezone
 from typing import Optional
 from sqlmodel import SQLModel, Field
-from sqlalchemy import Index
+from sqlalchemy import Column, DateTime, Index, func, text
 
 
 class TransactionBase(SQLModel):
@@ -16,8 +16,23 @@ class TransactionBase(SQLModel):
 class Transaction(TransactionBase, table=True):
     """Transaction database model"""
     id: Optional[int] = Field(default=None, primary_key=True)
-    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
-    updated_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    # Timestamps are set by the database on insert / update. default renders now() into the INSERT
+    # itself, so tables created before the server defaults existed (no DEFAULT, see Development.md)
+    # still get a value; server_default covers rows written outside the ORM
+    created_at: Optional[datetime] = Field(
+        default=None,
+        sa_column=Column(DateTime(timezone=True), default=func.now(), server_default=func.now(), nullable=False)
+    )
+    updated_at: Optional[datetime] = Field(
+        default=None,
+        sa_column=Column(
+            DateTime(timezone=True), default=func.now(), server_default=func.now(),
+            onupdate=func.now(), nullable=False
+        )
+    )
+    
+    # Fetch the server-generated timestamps with RETURNING on INSERT/UPDATE instead of a refresh SELECT
+    __mapper_args__ = {"eager_defaults": True}
     
     # Add indexes for better query performance
     __table_args__ = (
@@ -25,6 +40,9 @@ class Transaction(TransactionBase, table=True):
         Index('idx_transaction_book_id', 'book_id'),
         Index('idx_transaction_is_returned', 'is_returned'),
         Index('idx_transaction_borrow_date', 'borrow_date'),
+        # Partial index holding only active loans - serves the availability counts
+        Index('idx_transaction_active_book', 'book_id',
+              postgresql_where=text('is_returned = false'), sqlite_where=text('is_returned = false')),
     )
 
 
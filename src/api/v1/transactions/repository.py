@@ -1,40 +1,73 @@
+from sqlalchemy import Row, func, insert, literal, select, update
 from sqlalchemy.orm import Session
 from sqlalchemy.exc import IntegrityError, SQLAlchemyError
 from typing import List, Optional
 from datetime import datetime, timezone
 
 from .models import Transaction, TransactionCreate, TransactionUpdate
+# Every transaction write changes availability, so each one clears the cached book list pages
+from ..books.repository import invalidate_books_cache
+from ...db.versions import bump_table_version, get_table_version
 
 
 def create_transaction(db: Session, transaction_data: TransactionCreate) -> Transaction:
     """Create a new transaction (borrow request)
     
-    Validates that the book has available copies before allowing the borrow
+    The availability check and the insert run as one INSERT ... SELECT ... WHERE,
+    so no row is written when no copy is free. On PostgreSQL borrows of the same ISBN are
+    serialized first, otherwise two concurrent borrows of the last copy could both pass the check
     """
     try: 
-        from ..books.repository import calculate_available_copies
+        from ..books.models import Book
         
-        # Check if book exists and has available copies
-        available = calculate_available_copies(db, transaction_data.book_id)
-        if available <= 0:
-            raise ValueError("No available copies of this book to borrow")
+        if db.get_bind().dialect.name == "postgresql":
+            # Transaction-scoped advisory lock on the ISBN, held until commit/rollback. Taken in its own
+            # statement so the INSERT below reads the borrows committed while it was waiting
+            db.execute(
+                select(func.pg_advisory_xact_lock(func.hashtext(Book.isbn)))
+                .where(Book.id == transaction_data.book_id)
+            )
         
-        db_transaction = Transaction(
-            user_id=transaction_data.user_id,
-            book_id=transaction_data.book_id,
-            borrow_date=transaction_data.borrow_date,
-            is_returned=False
+        # Copies of the book's ISBN and how many of them are currently borrowed
+        isbn = select(Book.isbn).where(Book.id == transaction_data.book_id).scalar_subquery()
+        total = select(func.count(Book.id)).where(Book.isbn == isbn).scalar_subquery()
+        borrowed = (
+            select(func.count(Transaction.id))
+            .join(Book, Book.id == Transaction.book_id)
+            .where(Book.isbn == isbn, Transaction.is_returned == False)
+            .scalar_subquery()
         )
-        db.add(db_transaction)
+        
+        # created_at / updated_at are filled in by the column defaults (now())
+        columns = Transaction.__table__.c
+        row = select(
+            literal(transaction_data.user_id, columns.user_id.type),
+            literal(transaction_data.book_id, columns.book_id.type),
+            literal(transaction_data.borrow_date, columns.borrow_date.type),
+            literal(False, columns.is_returned.type),
+        ).where(total > borrowed)
+        stmt = insert(Transaction).from_select(
+            ["user_id", "book_id", "borrow_date", "is_returned"], row
+        ).returning(Transaction)
+        
+        db_transaction = db.scalars(stmt).first()
+        if db_transaction is None:
+            db.rollback()
+            # Nothing inserted - either the book does not exist or every copy is out
+            if db.get(Book, transaction_data.book_id) is None:
+                raise ValueError("Book not found")
+            raise ValueError("No available copies of this book to borrow")
+        
+        bump_table_version(db, Transaction.__tablename__)
         db.commit()
-        db.refresh(db_transaction)
+        invalidate_books_cache()
         return db_transaction
     except IntegrityError as e:
         db.rollback()
-        print(e)
-        if "user_id" in str(e):
+        # Match on the driver message only - str(e) includes the SQL, which names every column
+        if "user_id" in str(e.orig):
             raise ValueError("User not found")
-        if "book_id" in str(e):
+        if "book_id" in str(e.orig):
             raise ValueError("Book not found")
         raise ValueError(f"Data integrity error: {str(e)}")
     except SQLAlchemyError as e:
@@ -45,46 +78,72 @@ def create_transaction(db: Session, transaction_data: TransactionCreate) -> Tran
 def get_transaction_by_id(db: Session, transaction_id: int) -> Optional[Transaction]:
     """Get transaction by ID"""
     try:
-        return db.query(Transaction).filter(Transaction.id == transaction_id).first()
+        return db.get(Transaction, transaction_id)
     except SQLAlchemyError as e:
         raise RuntimeError(f"Database error while retrieving transaction: {str(e)}")
 
 
-def get_transactions_by_user(db: Session, user_id: int, skip: int = 0, limit: int = 10, is_returned: Optional[bool] = None) -> List[Transaction]:
+# Transaction maps user_id/book_id as plain foreign keys (no relationships) and TransactionResponse
+# only exposes those ids, so the list readers below have nothing to eager-load per row: each page,
+# admin listings included, is exactly one SELECT whatever the page size. If user/book relationships
+# are ever added to the response, load them with selectinload (not joinedload) to keep it bounded.
+# Pages are only serialized, so they are read as plain Core rows instead of ORM instances
+def _select_transactions_page(
+    *criteria,
+    skip: int,
+    limit: int,
+    is_returned: Optional[bool],
+    after_id: Optional[int]
+):
+    """Build a SELECT of whole transaction rows with the list filters and pagination applied"""
+    stmt = select(*Transaction.__table__.c).where(*criteria)
+    
+    if is_returned is not None:
+        stmt = stmt.where(Transaction.is_returned == is_returned)
+    
+    stmt = stmt.order_by(Transaction.id)
+    if after_id is not None:
+        stmt = stmt.where(Transaction.id > after_id)
+    else:
+        stmt = stmt.offset(skip)
+    return stmt.limit(limit)
+
+
+def get_transactions_by_user(db: Session, user_id: int, skip: int = 0, limit: int = 10, is_returned: Optional[bool] = None, after_id: Optional[int] = None) -> List[Row]:
     """Get all transactions for a user"""
     try:
-        query = db.query(Transaction).filter(Transaction.user_id == user_id)
-        
-        if is_returned is not None:
-            query = query.filter(Transaction.is_returned == is_returned)
-        
-        return query.offset(skip).limit(limit).all()
+        stmt = _select_transactions_page(
+            Transaction.user_id == user_id, skip=skip, limit=limit, is_returned=is_returned, after_id=after_id
+        )
+        return db.execute(stmt).all()
     except SQLAlchemyError as e:
         raise RuntimeError(f"Database error while retrieving transactions: {str(e)}")
 
 
-def get_transactions_by_book(db: Session, book_id: int, skip: int = 0, limit: int = 10, is_returned: Optional[bool] = None) -> List[Transaction]:
+def get_transactions_by_book(db: Session, book_id: int, skip: int = 0, limit: int = 10, is_returned: Optional[bool] = None, after_id: Optional[int] = None) -> List[Row]:
     """Get all transactions for a book"""
     try:
-        query = db.query(Transaction).filter(Transaction.book_id == book_id)
-        
-        if is_returned is not None:
-            query = query.filter(Transaction.is_returned == is_returned)
-        
-        return query.offset(skip).limit(limit).all()
+        stmt = _select_transactions_page(
+            Transaction.book_id == book_id, skip=skip, limit=limit, is_returned=is_returned, after_id=after_id
+        )
+        return db.execute(stmt).all()
     except SQLAlchemyError as e:
         raise RuntimeError(f"Database error while retrieving transactions: {str(e)}")
 
 
-def get_all_transactions(db: Session, skip: int = 0, limit: int = 10, is_returned: Optional[bool] = None) -> List[Transaction]:
+def get_all_transactions(db: Session, skip: int = 0, limit: int = 10, is_returned: Optional[bool] = None, after_id: Optional[int] = None) -> List[Row]:
     """Get all transactions with optional filtering"""
     try:
-        query = db.query(Transaction)
-        
-        if is_returned is not None:
-            query = query.filter(Transaction.is_returned == is_returned)
-        
-        return query.offset(skip).limit(limit).all()
+        stmt = _select_transactions_page(skip=skip, limit=limit, is_returned=is_returned, after_id=after_id)
+        return db.execute(stmt).all()
+    except SQLAlchemyError as e:
+        raise RuntimeError(f"Database error while retrieving transactions: {str(e)}")
+
+
+def get_transactions_version(db: Session) -> int:
+    """Write counter of the transaction table - changes whenever any transaction is created, updated or deleted"""
+    try:
+        return get_table_version(db, Transaction.__tablename__)
     except SQLAlchemyError as e:
         raise RuntimeError(f"Database error while retrieving transactions: {str(e)}")
 
@@ -97,9 +156,9 @@ def update_transaction(db: Session, transaction: Transaction, transaction_update
         for field, value in update_data.items():
             setattr(transaction, field, value)
         
-        transaction.updated_at = datetime.now(timezone.utc)
+        bump_table_version(db, Transaction.__tablename__)
         db.commit()
-        db.refresh(transaction)
+        invalidate_books_cache()
         
         return transaction
     except SQLAlchemyError as e:
@@ -107,26 +166,35 @@ def update_transaction(db: Session, transaction: Transaction, transaction_update
         raise RuntimeError(f"Database error while updating transaction: {str(e)}")
 
 
-def return_book(db: Session, transaction_id: int) -> Transaction:
-    """Mark a book as returned"""
+def return_book(db: Session, transaction_id: int, user_id: Optional[int] = None) -> Optional[Transaction]:
+    """Mark a book as returned
+    
+    Runs as a single UPDATE ... WHERE is_returned = false RETURNING, so two concurrent returns
+    cannot both succeed. When user_id is given only that user's transaction is matched
+    
+    Returns:
+        The updated transaction, or None if no unreturned transaction matched
+    """
     try:
-        transaction = db.query(Transaction).filter(Transaction.id == transaction_id).first()
-        if not transaction:
-            raise ValueError("Transaction not found")
-        
-        if transaction.is_returned:
-            raise ValueError("Book already returned")
+        stmt = (
+            update(Transaction)
+            .where(Transaction.id == transaction_id, Transaction.is_returned == False)
+            .values(is_returned=True, return_date=datetime.now(timezone.utc))
+            .returning(Transaction)
+        )
+        if user_id is not None:
+            stmt = stmt.where(Transaction.user_id == user_id)
         
-        transaction.return_date = datetime.now(timezone.utc)
-        transaction.is_returned = True
-        transaction.updated_at = datetime.now(timezone.utc)
+        transaction = db.scalars(stmt).one_or_none()
+        if transaction is None:
+            db.rollback()
+            return None
         
+        bump_table_version(db, Transaction.__tablename__)
         db.commit()
-        db.refresh(transaction)
+        invalidate_books_cache()
         
         return transaction
-    except ValueError:
-        raise
     except SQLAlchemyError as e:
         db.rollback()
         raise RuntimeError(f"Database error while returning book: {str(e)}")
@@ -136,7 +204,9 @@ def delete_transaction(db: Session, transaction: Transaction) -> None:
     """Delete a transaction"""
     try:
         db.delete(transaction)
+        bump_table_version(db, Transaction.__tablename__)
         db.commit()
+        invalidate_books_cache()
     except SQLAlchemyError as e:
         db.rollback()
         raise RuntimeError(f"Database error while deleting transaction: {str(e)}")
@@ -1,4 +1,5 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from pydantic import TypeAdapter
 from sqlalchemy.orm import Session
 from typing import List, Optional
 
@@ -8,196 +9,155 @@ from .models import (
 from .repository import (
     create_transaction, get_transaction_by_id, get_transactions_by_user,
     get_transactions_by_book, get_all_transactions, update_transaction,
-    return_book, delete_transaction
+    return_book, delete_transaction, get_transactions_version
 )
 from ...db.session import get_session
-from ..users.routing import get_current_user
-from ..users.models import UserRole
+from ..users.routing import get_current_user, not_modified, require_admin, set_next_cursor
 
 router = APIRouter()
 
-
-def require_admin(current_user = Depends(get_current_user)):
-    """Dependency to require admin role"""
-    if current_user.role != UserRole.ADMIN:
-        raise HTTPException(status_code=403, detail="Admin access required")
-    return current_user
+TRANSACTION_LIST_ADAPTER = TypeAdapter(List[TransactionResponse])
 
 
 @router.post("", response_model=TransactionResponse, status_code=201)
-async def create_transaction_endpoint(
+def create_transaction_endpoint(
     transaction_data: TransactionCreate,
-    db: Session = Depends(get_session),
+    db: Session = Depends(get_session, scope="function"),
     current_user = Depends(get_current_user)
 ):
     """Create a new transaction (borrow a book) - Protected (All Users)"""
-    try:
-        transaction = create_transaction(db, transaction_data)
-        return TransactionResponse.model_validate(transaction)
-    except ValueError as e:
-        raise HTTPException(status_code=400, detail=str(e))
-    except RuntimeError as e:
-        raise HTTPException(status_code=500, detail=str(e))
-    except Exception as e:
-        raise HTTPException(status_code=500, detail="An unexpected error occurred")
+    transaction = create_transaction(db, transaction_data)
+    return TransactionResponse.model_validate(transaction)
 
 
 @router.get("/{transaction_id}", response_model=TransactionResponse)
-async def get_transaction_endpoint(
+def get_transaction_endpoint(
     transaction_id: int,
-    db: Session = Depends(get_session),
+    db: Session = Depends(get_session, scope="function"),
     current_user = Depends(get_current_user)
 ):
     """Get transaction by ID - Protected (Owner or Admin)"""
-    try:
-        transaction = get_transaction_by_id(db, transaction_id)
-        if not transaction:
-            raise HTTPException(status_code=404, detail=f"Transaction with ID {transaction_id} not found")
-        
-        # Check authorization: user can only see own transactions, admins can see all
-        if current_user.id != transaction.user_id and current_user.role != UserRole.ADMIN:
-            raise HTTPException(status_code=403, detail="Cannot access another user's transaction")
-        
-        return TransactionResponse.model_validate(transaction)
-    except RuntimeError as e:
-        raise HTTPException(status_code=500, detail=str(e))
-    except HTTPException:
-        raise
-    except Exception as e:
-        raise HTTPException(status_code=500, detail="An unexpected error occurred")
+    transaction = get_transaction_by_id(db, transaction_id)
+    if not transaction:
+        raise HTTPException(status_code=404, detail=f"Transaction with ID {transaction_id} not found")
+    
+    # Check authorization: user can only see own transactions, admins can see all
+    if current_user.id != transaction.user_id and not current_user.is_admin:
+        raise HTTPException(status_code=403, detail="Cannot access another user's transaction")
+    
+    return TransactionResponse.model_validate(transaction)
 
 
 @router.get("/user/{user_id}", response_model=List[TransactionResponse])
-async def get_user_transactions_endpoint(
+def get_user_transactions_endpoint(
     user_id: int,
-    skip: int = Query(0, ge=0),
+    response: Response,
+    skip: int = Query(0, ge=0, deprecated=True, description="Offset paging, use after_id instead"),
     limit: int = Query(10, ge=1, le=100),
+    after_id: Optional[int] = Query(None, description="Return items after this id (X-Next-Cursor of the previous page)"),
     is_returned: Optional[bool] = Query(None),
-    db: Session = Depends(get_session),
+    db: Session = Depends(get_session, scope="function"),
     current_user = Depends(get_current_user)
 ):
     """Get all transactions for a user - Protected (Owner or Admin)"""
-    try:
-        # Check authorization: user can only see own transactions, admins can see all
-        if current_user.id != user_id and current_user.role != UserRole.ADMIN:
-            raise HTTPException(status_code=403, detail="Cannot access another user's transactions")
-        
-        transactions = get_transactions_by_user(db, user_id, skip=skip, limit=limit, is_returned=is_returned)
-        return [TransactionResponse.model_validate(t) for t in transactions]
-    except RuntimeError as e:
-        raise HTTPException(status_code=500, detail=str(e))
-    except HTTPException:
-        raise
-    except Exception as e:
-        raise HTTPException(status_code=500, detail="An unexpected error occurred")
+    # Check authorization: user can only see own transactions, admins can see all
+    if current_user.id != user_id and not current_user.is_admin:
+        raise HTTPException(status_code=403, detail="Cannot access another user's transactions")
+    
+    transactions = get_transactions_by_user(db, user_id, skip=skip, limit=limit, is_returned=is_returned, after_id=after_id)
+    set_next_cursor(response, transactions, limit)
+    return TRANSACTION_LIST_ADAPTER.validate_python(transactions, from_attributes=True)
 
 
 @router.get("/book/{book_id}", response_model=List[TransactionResponse])
-async def get_book_transactions_endpoint(
+def get_book_transactions_endpoint(
     book_id: int,
-    skip: int = Query(0, ge=0),
+    response: Response,
+    skip: int = Query(0, ge=0, deprecated=True, description="Offset paging, use after_id instead"),
     limit: int = Query(10, ge=1, le=100),
+    after_id: Optional[int] = Query(None, description="Return items after this id (X-Next-Cursor of the previous page)"),
     is_returned: Optional[bool] = Query(None),
-    db: Session = Depends(get_session),
+    db: Session = Depends(get_session, scope="function"),
     current_user = Depends(require_admin)
 ):
     """Get all transactions for a book - Admin Only"""
-    try:
-        transactions = get_transactions_by_book(db, book_id, skip=skip, limit=limit, is_returned=is_returned)
-        return [TransactionResponse.model_validate(t) for t in transactions]
-    except RuntimeError as e:
-        raise HTTPException(status_code=500, detail=str(e))
-    except Exception as e:
-        raise HTTPException(status_code=500, detail="An unexpected error occurred")
+    transactions = get_transactions_by_book(db, book_id, skip=skip, limit=limit, is_returned=is_returned, after_id=after_id)
+    set_next_cursor(response, transactions, limit)
+    return TRANSACTION_LIST_ADAPTER.validate_python(transactions, from_attributes=True)
  
   
 @router.get("", response_model=List[TransactionResponse])
-async def get_all_transactions_endpoint(
-    skip: int = Query(0, ge=0),
+def get_all_transactions_endpoint(
+    request: Request,
+    response: Response,
+    skip: int = Query(0, ge=0, deprecated=True, description="Offset paging, use after_id instead"),
     limit: int = Query(10, ge=1, le=100),
+    after_id: Optional[int] = Query(None, description="Return items after this id (X-Next-Cursor of the previous page)"),
     is_returned: Optional[bool] = Query(None),
-    db: Session = Depends(get_session),
+    db: Session = Depends(get_session, scope="function"),
     current_user = Depends(require_admin)
 ):
     """Get all transactions - Admin Only"""
-    try:
-        transactions = get_all_transactions(db, skip=skip, limit=limit, is_returned=is_returned)
-        return [TransactionResponse.model_validate(t) for t in transactions]
-    except RuntimeError as e:
-        raise HTTPException(status_code=500, detail=str(e))
-    except Exception as e:
-        raise HTTPException(status_code=500, detail="An unexpected error occurred")
+    unchanged = not_modified(request, response, get_transactions_version(db))
+    if unchanged is not None:
+        return unchanged
+    
+    transactions = get_all_transactions(db, skip=skip, limit=limit, is_returned=is_returned, after_id=after_id)
+    set_next_cursor(response, transactions, limit)
+    return TRANSACTION_LIST_ADAPTER.validate_python(transactions, from_attributes=True)
 
 
 @router.patch("/{transaction_id}", response_model=TransactionResponse)
-async def update_transaction_endpoint(
+def update_transaction_endpoint(
     transaction_id: int,
     transaction_update: TransactionUpdate,
-    db: Session = Depends(get_session),
+    db: Session = Depends(get_session, scope="function"),
     current_user = Depends(require_admin)
 ):
     """Update a transaction - Admin Only"""
-    try:
-        transaction = get_transaction_by_id(db, transaction_id)
-        if not transaction:
-            raise HTTPException(status_code=404, detail=f"Transaction with ID {transaction_id} not found")
-        
-        updated_transaction = update_transaction(db, transaction, transaction_update)
-        return TransactionResponse.model_validate(updated_transaction)
-    except ValueError as e:
-        raise HTTPException(status_code=400, detail=str(e))
-    except RuntimeError as e:
-        raise HTTPException(status_code=500, detail=str(e))
-    except HTTPException:
-        raise
-    except Exception as e:
-        raise HTTPException(status_code=500, detail="An unexpected error occurred")
+    transaction = get_transaction_by_id(db, transaction_id)
+    if not transaction:
+        raise HTTPException(status_code=404, detail=f"Transaction with ID {transaction_id} not found")
+    
+    updated_transaction = update_transaction(db, transaction, transaction_update)
+    return TransactionResponse.model_validate(updated_transaction)
 
 
 @router.post("/{transaction_id}/return", response_model=TransactionResponse)
-async def return_book_endpoint(
+def return_book_endpoint(
     transaction_id: int,
-    db: Session = Depends(get_session),
+    db: Session = Depends(get_session, scope="function"),
     current_user = Depends(get_current_user)
 ):
     """Mark a book as returned - Protected (Owner or Admin)"""
-    try:
-        transaction = get_transaction_by_id(db, transaction_id)
-        if not transaction:
-            raise HTTPException(status_code=404, detail=f"Transaction with ID {transaction_id} not found")
-        
-        # Check authorization: user can only return own books, admins can return any
-        if current_user.id != transaction.user_id and current_user.role != UserRole.ADMIN:
-            raise HTTPException(status_code=403, detail="Cannot return another user's book")
-        
-        transaction = return_book(db, transaction_id)
+    # Non-admins only match their own transactions, so the happy path is a single UPDATE
+    transaction = return_book(db, transaction_id, user_id=None if current_user.is_admin else current_user.id)
+    if transaction is not None:
         return TransactionResponse.model_validate(transaction)
-    except ValueError as e:
-        raise HTTPException(status_code=400, detail=str(e))
-    except RuntimeError as e:
-        raise HTTPException(status_code=500, detail=str(e))
-    except HTTPException:
-        raise
-    except Exception as e:
-        raise HTTPException(status_code=500, detail="An unexpected error occurred")
+    
+    # Nothing updated - find out why
+    transaction = get_transaction_by_id(db, transaction_id)
+    if not transaction:
+        raise HTTPException(status_code=404, detail=f"Transaction with ID {transaction_id} not found")
+    
+    # Check authorization: user can only return own books, admins can return any
+    if current_user.id != transaction.user_id and not current_user.is_admin:
+        raise HTTPException(status_code=403, detail="Cannot return another user's book")
+    
+    raise HTTPException(status_code=400, detail="Book already returned")
 
 
 @router.delete("/{transaction_id}", status_code=204)
-async def delete_transaction_endpoint(
+def delete_transaction_endpoint(
     transaction_id: int,
-    db: Session = Depends(get_session),
+    db: Session = Depends(get_session, scope="function"),
     current_user = Depends(require_admin)
 ):
     """Delete a transaction - Admin Only"""
-    try: 
-        transaction = get_transaction_by_id(db, transaction_id)
-        if not transaction:
-            raise HTTPException(status_code=404, detail=f"Transaction with ID {transaction_id} not found")
-        
-        delete_transaction(db, transaction)
-        return None
-    except RuntimeError as e:
-        raise HTTPException(status_code=500, detail=str(e))
-    except Exception as e:
-        raise HTTPException(status_code=500, detail="An unexpected error occurred")
+    transaction = get_transaction_by_id(db, transaction_id)
+    if not transaction:
+        raise HTTPException(status_code=404, detail=f"Transaction with ID {transaction_id} not found")
+    
+    delete_transaction(db, transaction)
+    return None
 
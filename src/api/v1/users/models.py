@@ -1,10 +1,24 @@
+import re
 from datetime import datetime, timezone
 from typing import Optional
+from pydantic import field_validator
 from sqlmodel import SQLModel, Field
 from sqlalchemy import Index
 from enum import Enum
 
 
+# Compiled once at import. Each part excludes the character that ends it (@, whitespace, dot),
+# so a match can only be found one way and the regex engine never backtracks - linear in length
+_EMAIL_RE = re.compile(r"[^@\s]+@[^@\s.]+(?:\.[^@\s.]+)+")
+
+
+def _validate_email(value: Optional[str]) -> Optional[str]:
+    """Reject values that are not shaped like local@domain.tld"""
+    if value is not None and _EMAIL_RE.fullmatch(value) is None:
+        raise ValueError("Invalid email address")
+    return value
+
+
 class UserRole(str, Enum):
     """User role enumeration"""
     ADMIN = "admin"
@@ -34,6 +48,11 @@ class User(UserBase, table=True):
         Index('idx_user_is_active', 'is_active'),
         Index('idx_user_role', 'role'),
     )
+    
+    @property
+    def is_admin(self) -> bool:
+        """Whether the user has the admin role"""
+        return self.role == UserRole.ADMIN
 
 
 class UserCreate(SQLModel):
@@ -42,6 +61,8 @@ class UserCreate(SQLModel):
     email: str = Field(max_length=254)
     password: str = Field(min_length=8, max_length=100)
     full_name: Optional[str] = Field(default=None, max_length=200)
+    
+    _check_email = field_validator("email")(_validate_email)
 
 
 class UserUpdate(SQLModel):
@@ -49,6 +70,8 @@ class UserUpdate(SQLModel):
     email: Optional[str] = Field(default=None, max_length=254)
     full_name: Optional[str] = Field(default=None, max_length=200)
     is_active: Optional[bool] = Field(default=None)
+    
+    _check_email = field_validator("email")(_validate_email)
 
 
 class UserResponse(UserBase):
@@ -1,24 +1,16 @@
+from sqlalchemy import Row, select
 from sqlalchemy.orm import Session
 from sqlalchemy.exc import IntegrityError, SQLAlchemyError
-from typing import List, Optional
+from typing import List, Optional, Union
 from datetime import datetime, timezone
 
 from .models import User, UserCreate, UserUpdate, UserRole
+from api.db.versions import bump_table_version, get_table_version
 from api.security.password import hash_password, verify_password
 
 def create_user(db: Session, user_data: UserCreate, role: UserRole = UserRole.REGULAR) -> User:
     """Create a new user"""
     try:
-        # Check if username already exists
-        existing_user = db.query(User).filter(User.username == user_data.username).first()
-        if existing_user:
-            raise ValueError("Username already exists")
-        
-        # Check if email already exists
-        existing_email = db.query(User).filter(User.email == user_data.email).first()
-        if existing_email:
-            raise ValueError("Email already exists")
-
         # Hash password
         hashed_password = hash_password(user_data.password)
         # Create user 
@@ -31,14 +23,17 @@ def create_user(db: Session, user_data: UserCreate, role: UserRole = UserRole.RE
             is_active=True
         )
         db.add(db_user)
+        bump_table_version(db, User.__tablename__)
         db.commit()
         db.refresh(db_user)
         return db_user 
     except IntegrityError as e:
+        # Duplicates are caught by the username/email unique constraints, no pre-check SELECTs.
+        # Match on the driver message only - str(e) also contains the INSERT column list
         db.rollback()
-        if "username" in str(e):
+        if "username" in str(e.orig):
             raise ValueError("Username already exists")
-        if "email" in str(e):
+        if "email" in str(e.orig):
             raise ValueError("Email already exists")
         raise ValueError(f"Data integrity error: {str(e)}")
     except SQLAlchemyError as e:
@@ -47,9 +42,9 @@ def create_user(db: Session, user_data: UserCreate, role: UserRole = UserRole.RE
 
 
 def get_user_by_id(db: Session, user_id: int) -> Optional[User]:
-    """Get user by ID"""
+    """Get user by ID, served from the session identity map when already loaded"""
     try:
-        return db.query(User).filter(User.id == user_id).first()
+        return db.get(User, user_id)
     except SQLAlchemyError as e:
         raise RuntimeError(f"Database error while retrieving user: {str(e)}")
 
@@ -70,40 +65,58 @@ def get_user_by_email(db: Session, email: str) -> Optional[User]:
         raise RuntimeError(f"Database error while retrieving user: {str(e)}")
 
 
-def get_users(
+# Columns serialized by UserResponse - everything except hashed_password
+USER_RESPONSE_COLUMNS = (
+    User.id, User.username, User.email, User.full_name,
+    User.is_active, User.role, User.created_at, User.updated_at,
+)
+
+
+def list_users_lite(
     db: Session,
     skip: int = 0,
     limit: int = 10,
     role: Optional[UserRole] = None,
-    is_active: Optional[bool] = None
-) -> List[User]:
-    """Get multiple users with optional filtering"""
+    is_active: Optional[bool] = None,
+    after_id: Optional[int] = None
+) -> List[Row]:
+    """Get a page of users as plain rows holding only the response columns
+    
+    Skips loading hashed_password and building ORM instances, for read-only listings
+    """
     try:
-        query = db.query(User)
+        stmt = select(*USER_RESPONSE_COLUMNS)
         
         if role:
-            query = query.filter(User.role == role)
+            stmt = stmt.where(User.role == role)
         
         if is_active is not None:
-            query = query.filter(User.is_active == is_active)
+            stmt = stmt.where(User.is_active == is_active)
         
-        return query.offset(skip).limit(limit).all()
+        stmt = stmt.order_by(User.id)
+        if after_id is not None:
+            stmt = stmt.where(User.id > after_id)
+        else:
+            stmt = stmt.offset(skip)
+        return db.execute(stmt.limit(limit)).all()
     except SQLAlchemyError as e:
         raise RuntimeError(f"Database error while retrieving users: {str(e)}")
 
 
-def update_user(db: Session, user: User, user_update: UserUpdate = None, new_password: Optional[str] = None, new_role: Optional[UserRole] = None, is_active: Optional[bool] = None) -> User:
+def get_users_version(db: Session) -> int:
+    """Write counter of the user table - changes whenever any user is created, updated or deleted"""
+    try:
+        return get_table_version(db, User.__tablename__)
+    except SQLAlchemyError as e:
+        raise RuntimeError(f"Database error while retrieving users: {str(e)}")
+
+
+def update_user(db: Session, user: User, user_update: Union[UserUpdate, dict, None] = None, new_password: Optional[str] = None, new_role: Optional[UserRole] = None, is_active: Optional[bool] = None) -> User:
     """Update user information - handles profile updates, password, role, and active status"""
     try:
-        # Update profile fields if provided
+        # Update profile fields if provided - either a UserUpdate or its already-dumped dict
         if user_update:
-            update_data = user_update.model_dump(exclude_unset=True)
-            
-            # Check if email is being updated and already exists
-            if "email" in update_data and update_data["email"] != user.email:
-                existing_email = db.query(User).filter(User.email == update_data["email"]).first()
-                if existing_email:
-                    raise ValueError("Email already exists")
+            update_data = user_update if isinstance(user_update, dict) else user_update.model_dump(exclude_unset=True)
             
             # Update fields
             for field, value in update_data.items():
@@ -123,13 +136,15 @@ def update_user(db: Session, user: User, user_update: UserUpdate = None, new_pas
         
         # Update timestamp and commit
         user.updated_at = datetime.now(timezone.utc)
+        bump_table_version(db, User.__tablename__)
         db.commit()
         db.refresh(user)
         
         return user
     except IntegrityError as e:
+        # A duplicate email is caught by the unique constraint
         db.rollback()
-        if "email" in str(e):
+        if "email" in str(e.orig):
             raise ValueError("Email already exists")
         raise ValueError(f"Data integrity error: {str(e)}")
     except SQLAlchemyError as e:
@@ -162,6 +177,7 @@ def delete_user(db: Session, user: User) -> None:
     """Delete a user"""
     try:
         db.delete(user)
+        bump_table_version(db, User.__tablename__)
         db.commit()
     except SQLAlchemyError as e:
         db.rollback()
@@ -1,250 +1,290 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
-from sqlalchemy.orm import Session
+import hashlib
+import logging
+import threading
+from cachetools import TTLCache
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from pydantic import TypeAdapter
+from sqlalchemy.orm import Session, make_transient_to_detached
 from typing import List, Optional
 
 from .models import (
-    UserCreate, UserUpdate, UserResponse, UserLogin, TokenResponse, UserRole
+    User, UserCreate, UserUpdate, UserResponse, UserLogin, TokenResponse, UserRole
 )
 from .repository import (
     create_user, get_user_by_id,
-    get_users, update_user, authenticate_user, delete_user
+    get_users_version, list_users_lite, update_user, authenticate_user, delete_user
 )
 from ...db.session import get_session
 from ...security.jwt_handler import create_access_token, verify_token
 from ...security.password import verify_password
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 
+logger = logging.getLogger(__name__)
+
 router = APIRouter()
 security = HTTPBearer()
 
+# Short-lived token -> user column values cache, lets repeat requests skip the user SELECT
+CURRENT_USER_CACHE_TTL = 30
+_current_user_cache = TTLCache(maxsize=2048, ttl=CURRENT_USER_CACHE_TTL)
+_current_user_cache_lock = threading.Lock()
 
-def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security), db: Session = Depends(get_session)):
-    """Dependency to get current user from JWT token"""
+# Validator for user list responses, built once instead of validating row by row
+USER_LIST_ADAPTER = TypeAdapter(List[UserResponse])
+
+
+def forget_cached_user(user_id: int) -> None:
+    """Drop cached entries for a user so the next request reloads it from the database"""
+    with _current_user_cache_lock:
+        for token in [t for t, values in _current_user_cache.items() if values["id"] == user_id]:
+            _current_user_cache.pop(token, None)
+
+
+def get_token_payload(credentials: HTTPAuthorizationCredentials = Depends(security)) -> dict:
+    """Dependency that verifies the JWT and returns its claims, without touching the database"""
     try:
-        token = credentials.credentials
-        payload = verify_token(token)
-        user_id: int = payload.get("sub")
-        if user_id is None:
-            raise HTTPException(status_code=401, detail="Invalid token")
-    except HTTPException:
-        raise
+        payload = verify_token(credentials.credentials)
     except Exception as e:
-        print(f"Token verification error: {str(e)}")
+        logger.debug("Token verification error: %s", e)
         raise HTTPException(status_code=401, detail="Invalid token")
+    if payload.get("sub") is None:
+        raise HTTPException(status_code=401, detail="Invalid token")
+    return payload
+
+
+def get_current_user(
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+    payload: dict = Depends(get_token_payload),
+    db: Session = Depends(get_session, scope="function")
+):
+    """Dependency to get current user from JWT token"""
+    token = credentials.credentials
+    user_id: int = payload["sub"]
+    
+    with _current_user_cache_lock:
+        cached = _current_user_cache.get(token)
+    if cached is not None:
+        # Attach a copy of the cached row to this request's session without hitting the database
+        user = User(**cached)
+        make_transient_to_detached(user)
+        return db.merge(user, load=False)
     
     user = get_user_by_id(db, user_id)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     
+    with _current_user_cache_lock:
+        _current_user_cache[token] = user.model_dump()
     return user
 
 
-def require_admin(current_user = Depends(get_current_user)):
-    """Dependency to require admin role"""
-    if current_user.role != UserRole.ADMIN:
+def set_next_cursor(response: Response, rows: list, limit: int) -> None:
+    """Expose the last id of a full page as the keyset cursor for the next page
+    
+    List readers order by id and, given the cursor as after_id, continue after it (keyset
+    pagination); without one they fall back to the deprecated skip offset
+    """
+    if len(rows) == limit:
+        response.headers["X-Next-Cursor"] = str(rows[-1].id)
+
+
+def not_modified(request: Request, response: Response, version: int) -> Optional[Response]:
+    """
+    Tag a listing with an ETag derived from the table's write counter and the query string
+    
+    Admin UIs poll these listings, so a 304 answers a repeat poll without loading or serializing
+    any rows while nothing was written. Returns that 304 response when the client's If-None-Match
+    already holds the tag, else None
+    """
+    digest = hashlib.blake2b(f"{version}|{request.url.query}".encode("utf-8"), digest_size=8)
+    etag = f'"{digest.hexdigest()}"'
+    if etag in request.headers.get("if-none-match", ""):
+        return Response(status_code=304, headers={"ETag": etag})
+    response.headers["ETag"] = etag
+    return None
+
+
+def require_admin_claim(payload: dict = Depends(get_token_payload)) -> dict:
+    """Reject tokens whose role claim is not admin, without touching the database"""
+    if payload.get("role") != UserRole.ADMIN.value:
+        raise HTTPException(status_code=403, detail="Admin access required")
+    return payload
+
+
+def require_admin(
+    payload: dict = Depends(require_admin_claim),
+    current_user = Depends(get_current_user)
+):
+    """Dependency to require admin role, shared by all routers
+    
+    Sub-dependencies resolve in order, so non-admin claims are rejected before the user is
+    looked up. A claim saying admin can be stale (demoted or deleted since the token was issued),
+    so it is confirmed against the current user - the same per-request value the endpoint or
+    router already depends on, cached and dropped by forget_cached_user on changes
+    """
+    if not current_user.is_admin:
         raise HTTPException(status_code=403, detail="Admin access required")
     return current_user
 
 
 @router.post("/register", response_model=TokenResponse, status_code=201)
-async def register_endpoint(
+def register_endpoint(
     user_data: UserCreate,
-    db: Session = Depends(get_session)
+    db: Session = Depends(get_session, scope="function")
 ):
     """Register a new user"""
-    try:
-        user = create_user(db, user_data, role=UserRole.REGULAR)
-        
-        # Create access token
-        access_token = create_access_token(data={"sub": user.id})
-        
-        return TokenResponse(
-            access_token=access_token,
-            user=UserResponse.model_validate(user)
-        )
-    except ValueError as e:
-        raise HTTPException(status_code=400, detail=str(e))
-    except RuntimeError as e:
-        raise HTTPException(status_code=500, detail=str(e))
-    except Exception as e:
-        raise HTTPException(status_code=500, detail="An unexpected error occurred during registration")
+    user = create_user(db, user_data, role=UserRole.REGULAR)
+    
+    # Create access token
+    access_token = create_access_token(data={"sub": user.id, "role": user.role.value})
+    
+    return TokenResponse(
+        access_token=access_token,
+        user=UserResponse.model_validate(user)
+    )
 
 
 @router.post("/login", response_model=TokenResponse)
-async def login_endpoint(
+def login_endpoint(
     credentials: UserLogin,
-    db: Session = Depends(get_session)
+    db: Session = Depends(get_session, scope="function")
 ):
     """Login user and get access token"""
-    try:
-        user = authenticate_user(db, credentials.username, credentials.password)
-        if not user:
-            raise HTTPException(status_code=401, detail="Invalid username or password")
-        
-        # Create access token
-        access_token = create_access_token(data={"sub": user.id})
-        
-        return TokenResponse(
-            access_token=access_token,
-            user=UserResponse.model_validate(user)
-        )
-    except RuntimeError as e:
-        raise HTTPException(status_code=500, detail=str(e))
-    except HTTPException:
-        raise
-    except Exception as e:
-        raise HTTPException(status_code=500, detail="An unexpected error occurred during login")
+    user = authenticate_user(db, credentials.username, credentials.password)
+    if not user:
+        raise HTTPException(status_code=401, detail="Invalid username or password")
+    
+    # Create access token
+    access_token = create_access_token(data={"sub": user.id, "role": user.role.value})
+    
+    return TokenResponse(
+        access_token=access_token,
+        user=UserResponse.model_validate(user)
+    )
 
 
 @router.get("/{user_id}", response_model=UserResponse)
-async def get_user_endpoint(
+def get_user_endpoint(
     user_id: int,
-    db: Session = Depends(get_session),
+    db: Session = Depends(get_session, scope="function"),
     current_user = Depends(get_current_user)
 ):
     """Get user by ID (owner or admin can view)"""
-    try:
-        user = get_user_by_id(db, user_id)
-        if not user:
-            raise HTTPException(status_code=404, detail=f"User with ID {user_id} not found")
-        
-        # Check if current user is the owner or admin
-        if current_user.id != user_id and current_user.role != UserRole.ADMIN:
-            raise HTTPException(status_code=403, detail="You can only view your own profile")
-        
-        return UserResponse.model_validate(user)
-    except RuntimeError as e:
-        raise HTTPException(status_code=500, detail=str(e))
-    except HTTPException:
-        raise
-    except Exception as e:
-        raise HTTPException(status_code=500, detail="An unexpected error occurred")
+    # Viewing your own profile reuses the authenticated user instead of loading it again
+    user = current_user if current_user.id == user_id else get_user_by_id(db, user_id)
+    if not user:
+        raise HTTPException(status_code=404, detail=f"User with ID {user_id} not found")
+    
+    # Check if current user is the owner or admin
+    if current_user.id != user_id and not current_user.is_admin:
+        raise HTTPException(status_code=403, detail="You can only view your own profile")
+    
+    return UserResponse.model_validate(user)
 
 
 @router.get("/", response_model=List[UserResponse])
-async def get_users_endpoint(
-    skip: int = Query(0, ge=0),
+def get_users_endpoint(
+    request: Request,
+    response: Response,
+    skip: int = Query(0, ge=0, deprecated=True, description="Offset paging, use after_id instead"),
     limit: int = Query(10, ge=1, le=100),
+    after_id: Optional[int] = Query(None, description="Return items after this id (X-Next-Cursor of the previous page)"),
     role: Optional[UserRole] = Query(None),
     is_active: Optional[bool] = Query(None),
-    db: Session = Depends(get_session),
+    db: Session = Depends(get_session, scope="function"),
     current_user = Depends(require_admin)
 ):
     """Get list of users (admin only)"""
-    try:
-        users = get_users(db, skip=skip, limit=limit, role=role, is_active=is_active)
-        return [UserResponse.model_validate(user) for user in users]
-    except RuntimeError as e:
-        raise HTTPException(status_code=500, detail=str(e))
-    except Exception as e:
-        raise HTTPException(status_code=500, detail="An unexpected error occurred")
+    unchanged = not_modified(request, response, get_users_version(db))
+    if unchanged is not None:
+        return unchanged
+    
+    users = list_users_lite(db, skip=skip, limit=limit, role=role, is_active=is_active, after_id=after_id)
+    set_next_cursor(response, users, limit)
+    return USER_LIST_ADAPTER.validate_python(users, from_attributes=True)
 
 
 @router.patch("/{user_id}", response_model=UserResponse)
-async def update_user_endpoint(
+def update_user_endpoint(
     user_id: int,
     user_update: UserUpdate,
-    db: Session = Depends(get_session),
+    db: Session = Depends(get_session, scope="function"),
     current_user = Depends(get_current_user)
 ):
     """Update user profile (owner or admin can update)"""
-    try:
-        user = get_user_by_id(db, user_id)
-        if not user:
-            raise HTTPException(status_code=404, detail=f"User with ID {user_id} not found")
-        
-        # Check if current user is the owner or admin
-        if current_user.id != user_id and current_user.role != UserRole.ADMIN:
-            raise HTTPException(status_code=403, detail="You can only update your own profile")
-        
-        # Non-admin users cannot update is_active or role - remove these fields from update
-        if current_user.role != UserRole.ADMIN:
-            # Create a copy of the update data excluding restricted fields
-            update_dict = user_update.model_dump(exclude_unset=True)
-            update_dict.pop('is_active', None)
-            user_update = UserUpdate(**update_dict)
-        
-        updated_user = update_user(db, user, user_update)
-        return UserResponse.model_validate(updated_user)
-    except ValueError as e:
-        raise HTTPException(status_code=400, detail=str(e))
-    except RuntimeError as e:
-        raise HTTPException(status_code=500, detail=str(e))
-    except HTTPException:
-        raise
-    except Exception as e:
-        raise HTTPException(status_code=500, detail="An unexpected error occurred")
+    user = current_user if current_user.id == user_id else get_user_by_id(db, user_id)
+    if not user:
+        raise HTTPException(status_code=404, detail=f"User with ID {user_id} not found")
+    
+    # Check if current user is the owner or admin
+    if current_user.id != user_id and not current_user.is_admin:
+        raise HTTPException(status_code=403, detail="You can only update your own profile")
+    
+    # Non-admin users cannot update is_active or role - remove these fields from update
+    update_data = user_update.model_dump(exclude_unset=True)
+    if not current_user.is_admin:
+        update_data.pop('is_active', None)
+    
+    updated_user = update_user(db, user, update_data)
+    forget_cached_user(user_id)
+    return UserResponse.model_validate(updated_user)
 
 
 @router.post("/{user_id}/change-password")
-async def change_password_endpoint(
+def change_password_endpoint(
     user_id: int,
     old_password: str,
     new_password: str,
-    db: Session = Depends(get_session),
+    db: Session = Depends(get_session, scope="function"),
     current_user = Depends(get_current_user)
 ):
     """Change user password"""
-    try:
-        # User can only change their own password unless they're admin
-        if current_user.id != user_id and current_user.role != UserRole.ADMIN:
-            raise HTTPException(status_code=403, detail="Cannot change another user's password")
-        
-        user = get_user_by_id(db, user_id)
-        if not user:
-            raise HTTPException(status_code=404, detail=f"User with ID {user_id} not found")
-        
-        # If not admin, verify old password
-        if current_user.role != UserRole.ADMIN:
-            if not verify_password(old_password, user.hashed_password):
-                raise HTTPException(status_code=400, detail="Invalid current password")
-        
-        update_user(db, user, UserUpdate(), new_password=new_password)
-        return {"message": "Password updated successfully"}
-    except ValueError as e:
-        raise HTTPException(status_code=400, detail=str(e))
-    except RuntimeError as e:
-        raise HTTPException(status_code=500, detail=str(e))
-    except Exception as e:
-        raise HTTPException(status_code=500, detail="An unexpected error occurred")
+    # User can only change their own password unless they're admin
+    if current_user.id != user_id and not current_user.is_admin:
+        raise HTTPException(status_code=403, detail="Cannot change another user's password")
+    
+    user = current_user if current_user.id == user_id else get_user_by_id(db, user_id)
+    if not user:
+        raise HTTPException(status_code=404, detail=f"User with ID {user_id} not found")
+    
+    # If not admin, verify old password
+    if not current_user.is_admin:
+        if not verify_password(old_password, user.hashed_password):
+            raise HTTPException(status_code=400, detail="Invalid current password")
+    
+    update_user(db, user, new_password=new_password)
+    forget_cached_user(user_id)
+    return {"message": "Password updated successfully"}
 
 
 @router.post("/{user_id}/role", response_model=UserResponse)
-async def update_user_role_endpoint(
+def update_user_role_endpoint(
     user_id: int,
     new_role: UserRole,
-    db: Session = Depends(get_session),
+    db: Session = Depends(get_session, scope="function"),
     current_user = Depends(require_admin)
 ):
     """Update user role (admin only)"""
-    try:
-        user = get_user_by_id(db, user_id)
-        if not user:
-            raise HTTPException(status_code=404, detail=f"User with ID {user_id} not found")
-        
-        updated_user = update_user(db, user, new_role=new_role)
-        return UserResponse.model_validate(updated_user)
-    except RuntimeError as e:
-        raise HTTPException(status_code=500, detail=str(e))
-    except Exception as e:
-        raise HTTPException(status_code=500, detail="An unexpected error occurred")
+    user = get_user_by_id(db, user_id)
+    if not user:
+        raise HTTPException(status_code=404, detail=f"User with ID {user_id} not found")
+    
+    updated_user = update_user(db, user, new_role=new_role)
+    forget_cached_user(user_id)
+    return UserResponse.model_validate(updated_user)
 
 
 @router.delete("/{user_id}", status_code=204)
-async def delete_user_endpoint(
+def delete_user_endpoint(
     user_id: int,
-    db: Session = Depends(get_session),
+    db: Session = Depends(get_session, scope="function"),
     current_user = Depends(require_admin)
 ):
     """Delete user (admin only)"""
-    try:
-        user = get_user_by_id(db, user_id)
-        if not user:
-            raise HTTPException(status_code=404, detail=f"User with ID {user_id} not found")
-        
-        delete_user(db, user)
-        return None
-    except RuntimeError as e:
-        raise HTTPException(status_code=500, detail=str(e))
-    except Exception as e:
-        raise HTTPException(status_code=500, detail="An unexpected error occurred")
+    user = get_user_by_id(db, user_id)
+    if not user:
+        raise HTTPException(status_code=404, detail=f"User with ID {user_id} not found")
+    
+    delete_user(db, user)
+    forget_cached_user(user_id)
+    return None
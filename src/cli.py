@@ -13,36 +13,21 @@ import sys
 import os
 from pathlib import Path
 
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
-from sqlmodel import SQLModel
-
-from api.db.config import DATABASE_URL
+# Shared engine, session factory and table setup from the app
+from api.db.session import SessionLocal, get_engine, init_db
 from api.v1.users.models import UserRole
 from api.v1.users.repository import create_user, get_user_by_username
 from api.v1.users.models import UserCreate
 
 
-# Create engine and session
-engine = create_engine(DATABASE_URL, echo=False)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-
-
-def init_db():
-    """Initialize database tables"""
-    from api.v1.authors.models import Author
-    from api.v1.books.models import Book
-    
-    SQLModel.metadata.create_all(engine)
-
-
 def create_admin():
     """Create a new admin user"""
+    db = None
     try:
         # Initialize database
         init_db()
         
-        db = SessionLocal()
+        db = SessionLocal(bind=get_engine())
         
         # Get input from environment variables or prompt user
         username = os.getenv('ADMIN_USERNAME') or input('Username: ')
@@ -78,7 +63,10 @@ def create_admin():
     except Exception as e:
         print(f"❌ Unexpected error: {str(e)}")
     finally:
-        db.close()
+        if db is not None:
+            db.close()
+        # One-shot script - close the pooled connections before exiting
+        get_engine().dispose()
 
 
 if __name__ == '__main__':
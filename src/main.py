@@ -1,7 +1,9 @@
 from typing import Union
 from contextlib import asynccontextmanager
-from api.db.session import init_db
-from fastapi import FastAPI
+from api.db.session import init_db, get_engine
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+from pydantic import ValidationError
 from api.v1.books.routing import router as books_router
 from api.v1.authors.routing import router as authors_router
 from api.v1.users.routing import router as users_router
@@ -13,12 +15,41 @@ async def lifespan(app: FastAPI):
     init_db()
     yield
     # clean up
+    get_engine().dispose()
 
 app = FastAPI(lifespan=lifespan)
-app.include_router(books_router, prefix="/api/v1/books")
-app.include_router(authors_router, prefix="/api/v1/authors")
-app.include_router(users_router, prefix="/api/v1/users")
-app.include_router(transactions_router, prefix="/api/v1/transactions")
+
+# Repository errors map to HTTP responses here instead of in every endpoint
+@app.exception_handler(ValidationError)
+async def validation_error_handler(request: Request, exc: ValidationError):
+    """Server-side model validation failed - a ValueError subclass, but not the client's fault"""
+    return JSONResponse(status_code=500, content={"detail": "An unexpected error occurred"})
+
+@app.exception_handler(ValueError)
+async def value_error_handler(request: Request, exc: ValueError):
+    """Validation / integrity errors raised by repositories"""
+    return JSONResponse(status_code=400, content={"detail": str(exc)})
+
+@app.exception_handler(RuntimeError)
+async def runtime_error_handler(request: Request, exc: RuntimeError):
+    """Database errors wrapped by repositories"""
+    return JSONResponse(status_code=500, content={"detail": str(exc)})
+
+@app.exception_handler(Exception)
+async def unexpected_error_handler(request: Request, exc: Exception):
+    """Anything else - don't leak internals to the client"""
+    return JSONResponse(status_code=500, content={"detail": "An unexpected error occurred"})
+
+# Every API router and its prefix, registered exactly once at import
+ROUTERS = (
+    (books_router, "/api/v1/books"),
+    (authors_router, "/api/v1/authors"),
+    (users_router, "/api/v1/users"),
+    (transactions_router, "/api/v1/transactions"),
+)
+
+for router, prefix in ROUTERS:
+    app.include_router(router, prefix=prefix)
 
 @app.get("/health")
 def read_health():